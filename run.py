@@ -3,14 +3,20 @@
 import os
 import subprocess as subp
 import re
+import json
+import struct
+import zipfile
+import posixpath
 import logging as log
+import numpy as np
 import matplotlib.pyplot as plt  # Add this import for plotting
 
-from time import perf_counter
+from time import perf_counter, strftime
+from heapq import heapify, heappop, heappush, nlargest
 from multiprocessing import Pool
 from math import log2
 from copy import deepcopy
-from typing import Dict, List, Optional
+from typing import BinaryIO, Dict, List, Optional, Tuple
 
 
 # Get current working directory path
@@ -64,6 +70,26 @@ sizes = [
         '65536'
         ]
 
+# Emit per-branch traces from the component (bimod, gshare, gselect) runs
+# so combining predictors can be evaluated offline by chooser_whatif()
+trace_bpreds = False
+
+# Meta table sizes evaluated by chooser_whatif() (sim-outorder default)
+meta_sizes = [
+        '1024'
+        ]
+
+# Profile per-static-branch misses from the traces with profile_hotspots()
+# (implies trace_bpreds, the combining predictor runs are traced as well)
+profile_bpreds = False
+
+# Max static branches tracked per predictor config and hot-spots reported
+profile_capacity = 4096
+profile_top_k = 20
+
+# Pack each sweep's results and logs into archive/ and drop the loose files
+archive_sweeps = False
+
 # Performance Patterns
 perf_pattrns = {
         'IPC': r'sim_IPC\s+([\d.]+)',
@@ -131,6 +157,8 @@ def setup_logger(fpath: str) -> None:
     log.basicConfig(level=log.INFO,
                     format='%(asctime)s - %(levelname)s - %(message)s',
                     datefmt='%Y-%m-%d %H:%M',
+                    # Reused pool workers switch to the new log file
+                    force=True,
                     handlers=[
                         log.FileHandler(fpath, mode='w', encoding='utf-8'),
                         log.StreamHandler()
@@ -270,113 +298,208 @@ def run_process_pool(cmds: List[str], logs: List[str]) -> None:
     print(f'Simulation Batch Duration: {t_duration:.2f}s')
 
 
-# Run simulation commands
-def run_simulations() -> None:
-    
-    cmd_template = []
-    print('run_simulations(): Running Simulations...') 
+# Build the sim-outorder per-branch trace option for a results file stem
+def trace_args(stem: str, option: str = '-bpred:trace', ext: str = 'bm', results_dir: Optional[str] = None, trace: Optional[bool] = None) -> str:
+    # Default to the trace_bpreds and profile_bpreds settings
+    if trace is None:
+        trace = trace_bpreds or profile_bpreds
 
-    # Loop through the benchmarks
-    for benchmark in benchmarks:
-        # Basic Branch predictors
-        nottaken_log_file = os.path.join(PATH, 'logs', f'{benchmark}_nottaken')
-        taken_log_file = os.path.join(PATH, 'logs', f'{benchmark}_taken')
+    # CHECK tracing is disabled
+    if not trace:
+        return ''
 
-        # Out of Order Not Taken
-        cmd_template.append(f'{PATH}/simulator/Run.pl -db {PATH}/simulator/bench.db -dir {PATH}/simulator/results/{benchmark}0 -benchmark {benchmark} -sim {PATH}/simulator/ss3/sim-outorder -args "-bpred nottaken -fastfwd 10000000 -max:inst 10000000" > {PATH}/simulator/results/{benchmark}_nottaken.out 2>&1')
+    # Default to the shared results directory
+    if results_dir is None:
+        results_dir = f'{PATH}/simulator/results'
 
-        # Out of Order Taken
-        cmd_template.append(f'{PATH}/simulator/Run.pl -db {PATH}/simulator/bench.db -dir {PATH}/simulator/results/{benchmark}1 -benchmark {benchmark} -sim {PATH}/simulator/ss3/sim-outorder -args "-bpred taken -fastfwd 10000000 -max:inst 10000000" > {PATH}/simulator/results/{benchmark}_taken.out 2>&1')
+    return f' {option} {results_dir}/traces/{stem}.{ext}'
 
-        log_file_paths = [
-                nottaken_log_file, 
-                taken_log_file 
-                ]
 
-        t_start = perf_counter()
+# Run.pl working directory suffix per bpred
+run_dirs = {
+        'nottaken': '0',
+        'taken': '1',
+        'bimod': '3',
+        'gshare': '4',
+        'gselect': '5',
+        'comb_bimod_gshare': '6',
+        'comb_bimod_gselect': '7'
+        }
 
-        run_process_pool(cmd_template, log_file_paths)
 
-        # Loop through the sizes
-        for size in sizes:
-            # Bimodal Branch Predictor
-            bimod_log_file = os.path.join(PATH, 'logs', f'{benchmark}_bimod_{size}')
+# Results file stem of a bpred config, sizes are left out for the basic bpreds
+def sim_stem(benchmark: str, bpred: str, size: Optional[str] = None) -> str:
+    # Basic Branch predictors
+    if bpred in ('nottaken', 'taken'):
+        return f'{benchmark}_{bpred}'
+
+    # Bimodal Branch Predictor
+    if bpred == 'bimod':
+        return f'{benchmark}_bimod_{size}'
+
+    # Calculate shift register width and subtract three due to PC 3 LSBs
+    shift_reg_width = str(int(log2(int(size)) - 3))
+
+    return f'{benchmark}_{bpred}_{size}_{shift_reg_width}'
 
-            # Calculate shift register width and subtract three due to PC 3 LSBs
-            shift_reg_width = str(int(log2(int(size)) - 3))
 
-            # gshare Branch Predictor
-            gshare_log_file = os.path.join(PATH, 'logs', f'{benchmark}_gshare_{size}_{shift_reg_width}')
+# Build the simulation command, log file and results file stem of a bpred config
+def sim_command(benchmark: str, bpred: str, size: Optional[str] = None, run_dir: Optional[str] = None, results_dir: Optional[str] = None, logs_dir: Optional[str] = None, trace: Optional[bool] = None) -> Tuple[str, str, str]:
+    stem = sim_stem(benchmark, bpred, size)
 
-            # gselect Branch Predictor
-            gselect_log_file = os.path.join(PATH, 'logs', f'{benchmark}_gselect_{size}_{shift_reg_width}')
+    # Basic Branch predictors
+    if bpred in ('nottaken', 'taken'):
+        bpred_args = f'-bpred {bpred}'
 
-            # Comb Bimod-gshare Branch Predictor
-            comb_bimod_gshare_log_file = os.path.join(PATH, 'logs', f'{benchmark}_comb_bimod_gshare_{size}_{shift_reg_width}')
+        # Committed conditional branch addresses for chooser_whatif()
+        if bpred == 'nottaken':
+            bpred_args += trace_args(benchmark, '-bpred:trace_addr', 'pc', results_dir, trace)
 
-            # Comb Bimod-gselect Branch Predictor
-            comb_bimod_gselect_log_file = os.path.join(PATH, 'logs', f'{benchmark}_comb_bimod_gselect_{size}_{shift_reg_width}')
+    # Bimodal Branch Predictor
+    elif bpred == 'bimod':
+        bpred_args = f'-bpred bimod -bpred:bimod {size}' + trace_args(stem, results_dir=results_dir, trace=trace)
 
+    else:
+        # Calculate shift register width and subtract three due to PC 3 LSBs
+        shift_reg_width = str(int(log2(int(size)) - 3))
+
+        # gshare xor (1) or gselect concat (2) index type
+        index_type = '1' if bpred.endswith('gshare') else '2'
+
+        # gshare and gselect Branch Predictors
+        if bpred in ('gshare', 'gselect'):
+            bpred_args = f'-bpred 2lev -bpred:2lev 1 {size} {shift_reg_width} {index_type}'
+
+        # Comb Bimod-gshare and Bimod-gselect Branch Predictors
+        else:
+            bpred_args = f'-bpred comb -bpred:bimod {size} -bpred:2lev 1 {size} {shift_reg_width} {index_type}'
+
+        # Hit bitmaps for chooser_whatif() and profile_hotspots()
+        bpred_args += trace_args(stem, results_dir=results_dir, trace=trace)
+
+    # Default to the shared per benchmark and bpred working directory
+    if run_dir is None:
+        run_dir = f'{PATH}/simulator/results/{benchmark}{run_dirs[bpred]}'
+
+    # Default to the shared results and log directories
+    if results_dir is None:
+        results_dir = f'{PATH}/simulator/results'
+
+    if logs_dir is None:
+        logs_dir = f'{PATH}/logs'
+
+    cmd = f'{PATH}/simulator/Run.pl -db {PATH}/simulator/bench.db -dir {run_dir} -benchmark {benchmark} -sim {PATH}/simulator/ss3/sim-outorder -args "{bpred_args} -fastfwd 10000000 -max:inst 10000000" > {results_dir}/{stem}.out 2>&1'
+    log_file = os.path.join(logs_dir, stem)
 
-            log_file_paths = [
-                    bimod_log_file,
-                    gshare_log_file,
-                    gselect_log_file,
-                    comb_bimod_gshare_log_file,
-                    comb_bimod_gselect_log_file
-                    ]
+    return cmd, log_file, stem
 
-            # Clear previous entries
-            cmd_template.clear()
 
-            # Out of Order Bimodal
-            cmd_template.append(f'{PATH}/simulator/Run.pl -db {PATH}/simulator/bench.db -dir {PATH}/simulator/results/{benchmark}3 -benchmark {benchmark} -sim {PATH}/simulator/ss3/sim-outorder -args "-bpred bimod -bpred:bimod {size} -fastfwd 10000000 -max:inst 10000000" > {PATH}/simulator/results/{benchmark}_bimod_{size}.out 2>&1')
+# Results, log and trace files written by a benchmark's simulations from sim_command()
+def sim_files(benchmark: str, stems: List[str], log_files: List[str]) -> List[str]:
+    files = list(log_files)
+
+    for stem in stems:
+        files.append(f'{PATH}/simulator/results/{stem}.out')
+
+        # CHECK tracing is enabled, of the basic bpreds only nottaken traces the addresses
+        if trace_bpreds or profile_bpreds:
+            if stem == f'{benchmark}_nottaken':
+                files.append(f'{PATH}/simulator/results/traces/{benchmark}.pc')
+
+            elif stem != f'{benchmark}_taken':
+                files.append(f'{PATH}/simulator/results/traces/{stem}.bm')
+
+    return files
+
+
+# Run simulation commands
+def run_simulations() -> List[str]:
+    print('run_simulations(): Running Simulations...') 
+
+    # Files written by this sweep for archive_sweep()
+    sweep_files = []
 
-            # Out of Order gshare
-            cmd_template.append(f'{PATH}/simulator/Run.pl -db {PATH}/simulator/bench.db -dir {PATH}/simulator/results/{benchmark}4 -benchmark {benchmark} -sim {PATH}/simulator/ss3/sim-outorder -args "-bpred 2lev -bpred:2lev 1 {size} {shift_reg_width} 1 -fastfwd 10000000 -max:inst 10000000" > {PATH}/simulator/results/{benchmark}_gshare_{size}_{shift_reg_width}.out 2>&1')
+    # Loop through the benchmarks
+    for benchmark in benchmarks:
+        # Out of Order Not Taken and Taken
+        cmd_template, log_file_paths, stems = zip(*[sim_command(benchmark, bpred) for bpred in ('nottaken', 'taken')])
+        sweep_files.extend(sim_files(benchmark, stems, log_file_paths))
 
-            # Out of Order gselect
-            cmd_template.append(f'{PATH}/simulator/Run.pl -db {PATH}/simulator/bench.db -dir {PATH}/simulator/results/{benchmark}5 -benchmark {benchmark} -sim {PATH}/simulator/ss3/sim-outorder -args "-bpred 2lev -bpred:2lev 1 {size} {shift_reg_width} 2 -fastfwd 10000000 -max:inst 10000000" > {PATH}/simulator/results/{benchmark}_gselect_{size}_{shift_reg_width}.out 2>&1')
+        t_start = perf_counter()
 
-            # Out of Order Bimodal-gshare
-            cmd_template.append(f'{PATH}/simulator/Run.pl -db {PATH}/simulator/bench.db -dir {PATH}/simulator/results/{benchmark}6 -benchmark {benchmark} -sim {PATH}/simulator/ss3/sim-outorder -args "-bpred comb -bpred:bimod {size} -bpred:2lev 1 {size} {shift_reg_width} 1 -fastfwd 10000000 -max:inst 10000000" > {PATH}/simulator/results/{benchmark}_comb_bimod_gshare_{size}_{shift_reg_width}.out 2>&1')
+        run_process_pool(list(cmd_template), list(log_file_paths))
 
-            # Out of Order Bimodal-gselect
-            cmd_template.append(f'{PATH}/simulator/Run.pl -db {PATH}/simulator/bench.db -dir {PATH}/simulator/results/{benchmark}7 -benchmark {benchmark} -sim {PATH}/simulator/ss3/sim-outorder -args "-bpred comb -bpred:bimod {size} -bpred:2lev 1 {size} {shift_reg_width} 2 -fastfwd 10000000 -max:inst 10000000" > {PATH}/simulator/results/{benchmark}_comb_bimod_gselect_{size}_{shift_reg_width}.out 2>&1')
+        # Loop through the sizes
+        for size in sizes:
+            # Out of Order Bimodal, gshare, gselect, Bimodal-gshare and Bimodal-gselect
+            cmd_template, log_file_paths, stems = zip(*[sim_command(benchmark, bpred, size) for bpred in ('bimod', 'gshare', 'gselect', 'comb_bimod_gshare', 'comb_bimod_gselect')])
+            sweep_files.extend(sim_files(benchmark, stems, log_file_paths))
 
             # Run batch with cmds and log files paths setup
-            run_process_pool(cmd_template, log_file_paths)
+            run_process_pool(list(cmd_template), list(log_file_paths))
             
         t_end = perf_counter()
         t_duration = t_end - t_start
         print(f'Simulation for {benchmark}, Total Duration: {t_duration:.2f}s')
 
+    return sweep_files
+
+
+# Match the performance patterns in results file content
+def parse_metrics(content: str) -> Dict[str, float]:
+    metrics = {}
+
+    # Loop through patterns
+    for metric, pattrn in perf_pattrns.items():
+        match = re.search(pattrn, content)
+
+        # CHECK match
+        if match:
+            metrics[metric] = float(match.group(1))
+
+    return metrics
+
+
+# Parse out which bpred, benchmark, size if it exists from a results filename
+def parse_filename(filename: str) -> Tuple[str, str, Optional[str]]:
+    bpred = re.search(r'^[a-z\d]+_([^\d]+)(?:_\d+.+?|\.out)', filename).group(1)
+    benchmark = re.search(r'^([a-z\d]+)_.+\.out$',filename).group(1)
+    size_match = re.search(r'^[a-z\d]+_.+?_(\d+)(?:_\d+)?\.out', filename)
+    size = size_match.group(1) if size_match != None else None
+
+    return bpred, benchmark, size
+
 
 # Parse data from results files
-def parse(file_path: str, bpred: str, benchmark: str, size: Optional[str] = None) -> None:
-    # Read file
-    with open(file_path, 'r') as f:
-        content = f.read()
+def parse(file_path: str, bpred: str, benchmark: str, size: Optional[str] = None, archive: Optional[zipfile.ZipFile] = None) -> None:
+    # CHECK file is a sweep archive member
+    if archive:
+        content = archive.read(file_path).decode()
+
+    # ELSE read file
+    else:
+        with open(file_path, 'r') as f:
+            content = f.read()
 
     # 0 for basic types and 1 for bimod and etc
     bpred_type = 0 if bpred in ('nottaken', 'taken') else 1
+
+    metrics = parse_metrics(content)
     
     # Loop through patterns
-    for metric, pattrn in perf_pattrns.items():
-        match = re.search(pattrn, content)
-
+    for metric in perf_pattrns.keys():
         # CHECK match and which bpred_type
-        if match and bpred_type == 0:
-            perf_data[bpred][benchmark][metric] = float(match.group(1))
+        if metric in metrics and bpred_type == 0:
+            perf_data[bpred][benchmark][metric] = metrics[metric]
 
-        elif match and bpred_type:
-            perf_data[bpred][benchmark][size][metric] = float(match.group(1))
+        elif metric in metrics and bpred_type:
+            perf_data[bpred][benchmark][size][metric] = metrics[metric]
 
         else:
             print(f'{file_path} does not contain metric: {metric}')
 
 
-# Parse performance data from result files
+# Parse performance data from result files (results directory or sweep archive)
 def parse_performance_data(results_dir: str) -> Dict[str, float]:
     # Store the averages across all benchmarks per predictor type
     perf_avg_data = {
@@ -389,21 +512,28 @@ def parse_performance_data(results_dir: str) -> Dict[str, float]:
             'comb_bimod_gselect': {}
             }
 
-    # Store in list all 'files' only and ignore directories
-    files = [f for f in os.listdir(results_dir) if os.path.isfile(os.path.join(results_dir, f))]
+    # CHECK results come from a sweep archive
+    archive = zipfile.ZipFile(results_dir) if zipfile.is_zipfile(results_dir) else None
+
+    if archive:
+        # Store in list all result 'files' only and ignore subdirectories
+        files = [name for name in archive.namelist() if posixpath.dirname(name) == 'results']
+
+    else:
+        # Store in list all 'files' only and ignore directories
+        files = [os.path.join(results_dir, f) for f in os.listdir(results_dir) if os.path.isfile(os.path.join(results_dir, f))]
+
+    # Loop through file paths
+    for file_path in files:
+        filename = posixpath.basename(file_path) if archive else os.path.basename(file_path)
 
-    # Loop through filenames
-    for filename in files:
-        file_path = os.path.join(results_dir, filename) 
-        
         # Parse out which bpred, benchmark, size if it exists from filename
-        bpred = re.search(r'^[a-z]+_([^\d]+)(?:_\d+.+?|\.out)', filename).group(1)
-        benchmark = re.search(r'^([a-z]+)_.+\.out$',filename).group(1)
-        size_match = re.search(r'^[a-z]+_.+?_(\d+)(?:_\d+)?\.out', filename)
-        size = size_match.group(1) if size_match != None else None
+        bpred, benchmark, size = parse_filename(filename)
         
-        parse(file_path, bpred, benchmark, size)
+        parse(file_path, bpred, benchmark, size, archive)
 
+    if archive:
+        archive.close()
 
     # Loop through bpreds from global performance data
     for bpred in perf_data.keys():
@@ -479,6 +609,406 @@ def parse_performance_data(results_dir: str) -> Dict[str, float]:
     return perf_avg_data
 
 
+# Read a per-branch trace header, leaving the file at the first entry
+def read_trace_header(f: BinaryIO, file_path: str) -> Tuple[np.dtype, int]:
+    # Header: magic, entry width in bits, entry count
+    magic, width, count = struct.unpack('<4sIQ', f.read(16))
+
+    # CHECK file is a trace
+    if magic not in (b'BPBM', b'BPPC'):
+        raise ValueError(f'{file_path} is not a branch trace')
+
+    # Bitmaps stay packed (MSB first), addresses are one word each
+    dtype = np.dtype(np.uint8) if width == 1 else np.dtype(f'<u{width // 8}')
+
+    return dtype, count
+
+
+# Path of a trace in the traces directory or in a sweep archive's results/traces/
+def trace_path(traces_dir: str, name: str, archive: Optional[zipfile.ZipFile] = None) -> str:
+    return posixpath.join('results', 'traces', name) if archive else os.path.join(traces_dir, name)
+
+
+# Open a trace file or sweep archive member
+def open_trace(file_path: str, archive: Optional[zipfile.ZipFile] = None) -> BinaryIO:
+    return archive.open(file_path) if archive else open(file_path, 'rb')
+
+
+# Read count trace entries (all if -1) at the current position
+def read_entries(f: BinaryIO, dtype: np.dtype, count: int = -1) -> np.ndarray:
+    # CHECK archive member, zip streams have no file descriptor for np.fromfile()
+    if isinstance(f, zipfile.ZipExtFile):
+        return np.frombuffer(f.read(count * dtype.itemsize if count >= 0 else -1), dtype=dtype)
+
+    return np.fromfile(f, dtype=dtype, count=count)
+
+
+# Read a per-branch trace written by sim-outorder -bpred:trace{,_addr}
+def read_trace(file_path: str, archive: Optional[zipfile.ZipFile] = None) -> Tuple[np.ndarray, int]:
+    with open_trace(file_path, archive) as f:
+        dtype, count = read_trace_header(f, file_path)
+        data = read_entries(f, dtype)
+
+    return data, count
+
+
+# Entry count of a trace without reading its entries
+def trace_count(file_path: str, archive: Optional[zipfile.ZipFile] = None) -> int:
+    with open_trace(file_path, archive) as f:
+        return read_trace_header(f, file_path)[1]
+
+
+# First count entries of a packed hit bitmap with the padding bits cleared
+def trim_bits(bits: np.ndarray, count: int) -> np.ndarray:
+    bits = bits[:(count + 7) // 8].copy()
+
+    # CHECK last byte is partial
+    if count % 8:
+        bits[-1] &= (0xff << (8 - count % 8)) & 0xff
+
+    return bits
+
+
+# Meta table index of branch addresses (BIMOD_HASH in bpred.c)
+def meta_index(pcs: np.ndarray, meta_size: int) -> np.ndarray:
+    pcs = pcs.astype(np.uint64)
+
+    return (((pcs >> 19) ^ (pcs >> 3)) & (meta_size - 1)).astype(np.int64)
+
+
+# Evaluate a bimod + 2lev chooser from the component hit bitmaps
+def evaluate_chooser(bimod_bits: np.ndarray, twolev_bits: np.ndarray, pcs: np.ndarray, count: int, meta_size: int) -> Dict[str, float]:
+    # CHECK empty or unfinished trace (header count is written on close)
+    if count == 0:
+        print('evaluate_chooser(): no committed branches to evaluate')
+
+        return {
+                'bpred_updates': 0,
+                'bpred_dir_hits': 0,
+                'bpred_misses': 0,
+                'bpred_dir_rate': 0.0,
+                'bimod_dir_rate': 0.0,
+                'twolev_dir_rate': 0.0,
+                'oracle_dir_rate': 0.0
+                }
+
+    # Only the first count committed branches are evaluated
+    bimod_bits = trim_bits(bimod_bits, count)
+    twolev_bits = trim_bits(twolev_bits, count)
+    pcs = pcs[:count]
+
+    # Both components agree where the bitmaps match, the chooser is moot there
+    both_hits = int(np.bitwise_count(bimod_bits & twolev_bits).sum())
+
+    # Oracle chooser picks whichever component was correct
+    oracle_hits = int(np.bitwise_count(bimod_bits | twolev_bits).sum())
+
+    # Exactly one component is correct where the bitmaps differ
+    disagree = np.flatnonzero(np.unpackbits(bimod_bits ^ twolev_bits, count=count))
+    twolev_right = np.unpackbits(twolev_bits, count=count)[disagree]
+    index = meta_index(pcs[disagree], meta_size)
+
+    # Meta counters start weakly this-or-that like bpred_dir_create()
+    table = [1 + (entry & 1) for entry in range(meta_size)]
+    chooser_hits = 0
+
+    # Walk only the disagreements, the meta table is not updated otherwise
+    for entry, right in zip(index.tolist(), twolev_right.tolist()):
+        counter = table[entry]
+
+        # CHECK meta picked the correct component
+        if (counter >= 2) == right:
+            chooser_hits += 1
+
+        table[entry] = min(counter + 1, 3) if right else max(counter - 1, 0)
+
+    dir_hits = both_hits + chooser_hits
+
+    return {
+            'bpred_updates': count,
+            'bpred_dir_hits': dir_hits,
+            'bpred_misses': count - dir_hits,
+            'bpred_dir_rate': dir_hits / count,
+            'bimod_dir_rate': int(np.bitwise_count(bimod_bits).sum()) / count,
+            'twolev_dir_rate': int(np.bitwise_count(twolev_bits).sum()) / count,
+            'oracle_dir_rate': oracle_hits / count
+            }
+
+
+# Evaluate combining predictors from the component traces of run_simulations()
+def chooser_whatif(traces_dir: str, pairings: Optional[List[Tuple[str, str]]] = None) -> Dict[str, dict]:
+    print('chooser_whatif(): Evaluating combining predictors...')
+
+    # Default to the same bimod and 2lev size like the comb simulations
+    if pairings is None:
+        pairings = [(size, size) for size in sizes]
+
+    whatif_data = {
+            'comb_bimod_gshare': {},
+            'comb_bimod_gselect': {}
+            }
+
+    # CHECK traces come from a sweep archive
+    archive = zipfile.ZipFile(traces_dir) if zipfile.is_zipfile(traces_dir) else None
+
+    # Loop through benchmarks
+    for benchmark in benchmarks:
+        # Committed conditional branch addresses are the same for every bpred
+        pcs, count = read_trace(trace_path(traces_dir, f'{benchmark}.pc', archive), archive)
+
+        for bpred, twolev in (('comb_bimod_gshare', 'gshare'), ('comb_bimod_gselect', 'gselect')):
+            whatif_data[bpred].update({benchmark : {}})
+
+            # Loop through bimod and 2lev size pairs
+            for bimod_size, twolev_size in pairings:
+                shift_reg_width = str(int(log2(int(twolev_size)) - 3))
+
+                bimod_bits, bimod_count = read_trace(trace_path(traces_dir, f'{benchmark}_bimod_{bimod_size}.bm', archive), archive)
+                twolev_bits, twolev_count = read_trace(trace_path(traces_dir, f'{benchmark}_{twolev}_{twolev_size}_{shift_reg_width}.bm', archive), archive)
+
+                # Runs stopped by -max:inst may commit a few more branches in
+                # their last cycle, evaluate the committed branches in common
+                pair_count = min(count, bimod_count, twolev_count)
+
+                pair = f'{bimod_size}_{twolev_size}'
+                whatif_data[bpred][benchmark].update({pair : {}})
+
+                for meta_size in meta_sizes:
+                    whatif_data[bpred][benchmark][pair][meta_size] = evaluate_chooser(bimod_bits, twolev_bits, pcs, pair_count, int(meta_size))
+
+    if archive:
+        archive.close()
+
+    return whatif_data
+
+
+# Least mispredicted branch of a Space-Saving table, skipping stale heap entries
+def pop_min_branch(heap: List[Tuple[int, int]], table: Dict[int, List[int]]) -> Tuple[int, int]:
+    while True:
+        misses, pc = heappop(heap)
+        if pc in table and table[pc][1] == misses:
+            return misses, pc
+
+
+# Count per-static-branch executions and misses in a bounded Space-Saving table
+def profile_branches(pcs_path: str, bits_path: str, count: int, capacity: int = profile_capacity, chunk: int = 1 << 20, archive: Optional[zipfile.ZipFile] = None) -> Dict[str, object]:
+    # CHECK chunks split the bitmap on byte boundaries
+    if chunk % 8:
+        raise ValueError(f'chunk must be a multiple of 8, got {chunk}')
+
+    # Branch address -> [executions, misses, miss overestimate]
+    table = {}
+    # Min-heap of (misses, pc), entries go stale when a branch's misses grow
+    heap = []
+    evicted = False
+    total_misses = 0
+
+    with open_trace(pcs_path, archive) as pcs_f, open_trace(bits_path, archive) as bits_f:
+        pcs_dtype, _ = read_trace_header(pcs_f, pcs_path)
+        read_trace_header(bits_f, bits_path)
+
+        # Stream through both traces a chunk at a time
+        for start in range(0, count, chunk):
+            n = min(chunk, count - start)
+            pcs = read_entries(pcs_f, pcs_dtype, n)
+            bits = read_entries(bits_f, np.dtype(np.uint8), (n + 7) // 8)
+
+            # CHECK traces hold count entries
+            if len(pcs) < n or len(bits) < (n + 7) // 8:
+                raise ValueError(f'{pcs_path}, {bits_path}: trace shorter than {count} branches')
+
+            hits = np.unpackbits(bits, count=n)
+            chunk_pcs, inverse = np.unique(pcs, return_inverse=True)
+            execs = np.bincount(inverse, minlength=len(chunk_pcs))
+            misses = np.bincount(inverse[hits == 0], minlength=len(chunk_pcs))
+            total_misses += int(misses.sum())
+
+            for pc, n_execs, n_misses in zip(chunk_pcs.tolist(), execs.tolist(), misses.tolist()):
+                entry = table.get(pc)
+
+                if entry is None:
+                    if len(table) < capacity:
+                        entry = table[pc] = [0, 0, 0]
+                    # CHECK table full, a branch without misses can't displace any
+                    elif n_misses == 0:
+                        continue
+                    # Replace the least mispredicted branch, whose misses may all be this one's
+                    else:
+                        min_misses, min_pc = pop_min_branch(heap, table)
+                        del table[min_pc]
+                        entry = table[pc] = [0, min_misses, min_misses]
+                        evicted = True
+
+                entry[0] += n_execs
+                entry[1] += n_misses
+                heappush(heap, (entry[1], pc))
+
+            # Rebuild the heap once stale entries dominate
+            if len(heap) > 4 * capacity:
+                heap = [(entry[1], pc) for pc, entry in table.items()]
+                heapify(heap)
+
+    return {
+            'bpred_updates': count,
+            'bpred_misses': total_misses,
+            # Upper bound on the misses of any branch not in the table
+            'max_untracked_misses': min(entry[1] for entry in table.values()) if evicted else 0,
+            'branches': table
+            }
+
+
+# Most mispredicted static branches of a profile
+def top_branches(profile: Dict[str, object], k: int = profile_top_k) -> List[Dict[str, object]]:
+    top = nlargest(k, profile['branches'].items(), key=lambda item: (item[1][1], item[1][0]))
+
+    # Misses are overestimated by up to error, the miss rate uses the guaranteed part
+    return [{
+            'pc': f'0x{pc:08x}',
+            'execs': execs,
+            'misses': misses,
+            'error': error,
+            'miss_rate': (misses - error) / execs if execs else 0.0,
+            'share': misses / profile['bpred_misses'] if profile['bpred_misses'] else 0.0
+            } for pc, (execs, misses, error) in top]
+
+
+# Misses and overestimate of a branch, untracked ones missed between 0 and the table bound
+def branch_misses(profile: Dict[str, object], pc: int) -> Tuple[int, int]:
+    if pc in profile['branches']:
+        _, misses, error = profile['branches'][pc]
+        return misses, error
+
+    return 0, profile['max_untracked_misses']
+
+
+# Static branches accounting for most of the miss gap from base to other
+def profile_diff(base: Dict[str, object], other: Dict[str, object], k: int = profile_top_k) -> Dict[str, object]:
+    gap = other['bpred_misses'] - base['bpred_misses']
+
+    # Per-branch miss delta, positive where other mispredicts more
+    deltas = {}
+    for pc in base['branches'].keys() | other['branches'].keys():
+        base_misses, base_error = branch_misses(base, pc)
+        other_misses, other_error = branch_misses(other, pc)
+        deltas[pc] = (base_misses, other_misses, other_misses - base_misses, base_error + other_error)
+
+    # Largest deltas in the direction of the gap first
+    sign = 1 if gap >= 0 else -1
+    top = nlargest(k, deltas.items(), key=lambda item: sign * item[1][2])
+
+    branches = []
+    cumulative = 0
+    for pc, (base_misses, other_misses, delta, error) in top:
+        cumulative += delta
+        branches.append({
+            'pc': f'0x{pc:08x}',
+            'base_misses': base_misses,
+            'other_misses': other_misses,
+            'delta': delta,
+            # True delta lies within delta +- error
+            'error': error,
+            'approximate': error > 0,
+            'share': delta / gap if gap else 0.0,
+            'cumulative_share': cumulative / gap if gap else 0.0
+            })
+
+    return {
+            'gap': gap,
+            'branches': branches
+            }
+
+
+# Profile hot-spot branches of every traced bpred config from run_simulations()
+def profile_hotspots(traces_dir: str, profiles_dir: str) -> None:
+    print('profile_hotspots(): Profiling static branches...')
+
+    # CHECK traces come from a sweep archive
+    archive = zipfile.ZipFile(traces_dir) if zipfile.is_zipfile(traces_dir) else None
+
+    # Loop through benchmarks
+    for benchmark in benchmarks:
+        pcs_path = trace_path(traces_dir, f'{benchmark}.pc', archive)
+        pcs_count = trace_count(pcs_path, archive)
+
+        profile_data = {
+                'profiles': {},
+                'diffs': {}
+                }
+
+        # Loop through sizes
+        for size in sizes:
+            shift_reg_width = str(int(log2(int(size)) - 3))
+
+            # Config names follow the results file names
+            configs = {
+                    'bimod': f'bimod_{size}',
+                    'gshare': f'gshare_{size}_{shift_reg_width}',
+                    'gselect': f'gselect_{size}_{shift_reg_width}',
+                    'comb_bimod_gshare': f'comb_bimod_gshare_{size}_{shift_reg_width}',
+                    'comb_bimod_gselect': f'comb_bimod_gselect_{size}_{shift_reg_width}'
+                    }
+            bits_paths = {bpred: trace_path(traces_dir, f'{benchmark}_{config}.bm', archive) for bpred, config in configs.items()}
+
+            # Runs capped by -max:inst commit a few more branches in their last cycle, profile the ones common to all configs
+            count = min([pcs_count] + [trace_count(bits_path, archive) for bits_path in bits_paths.values()])
+
+            profiles = {}
+            for bpred, config in configs.items():
+                profiles[bpred] = profile_branches(pcs_path, bits_paths[bpred], count, archive=archive)
+
+                profile_data['profiles'][config] = {
+                        'bpred_updates': profiles[bpred]['bpred_updates'],
+                        'bpred_misses': profiles[bpred]['bpred_misses'],
+                        'max_untracked_misses': profiles[bpred]['max_untracked_misses'],
+                        'tracked_branches': len(profiles[bpred]['branches']),
+                        # Only the hot-spots are kept, the full tables would dwarf them
+                        'top': top_branches(profiles[bpred])
+                        }
+
+            # Where gselect loses (or wins) against gshare at the same size
+            profile_data['diffs'][f'gselect_vs_gshare_{size}'] = profile_diff(profiles['gshare'], profiles['gselect'])
+
+        with open(os.path.join(profiles_dir, f'{benchmark}.json'), 'w') as f:
+            json.dump(profile_data, f, indent=4)
+
+    if archive:
+        archive.close()
+
+
+# Pack a sweep's result and log files into one compressed, indexed archive
+def archive_sweep(archive_path: str, files: List[str], results_dir: str, logs_dir: str, remove: bool = False) -> None:
+    print(f'archive_sweep(): Archiving sweep to {archive_path}...')
+
+    members = []
+
+    # Only the files this sweep wrote, results and logs of other runs stay
+    for file_path in files:
+        # CHECK file was written, failed simulations leave some out
+        if not os.path.isfile(file_path):
+            continue
+
+        # Keep the results/ (traces/, profiles/) and logs/ layout
+        root, prefix = (logs_dir, 'logs') if os.path.commonpath([file_path, logs_dir]) == logs_dir else (results_dir, 'results')
+        arcname = posixpath.join(prefix, *os.path.relpath(file_path, root).split(os.sep))
+        members.append((file_path, arcname))
+
+    # The zip central directory keeps each member's offset for random reads
+    with zipfile.ZipFile(archive_path, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for file_path, arcname in members:
+            archive.write(file_path, arcname)
+
+    # CHECK loose files should be dropped once archived
+    if remove:
+        for file_path, arcname in members:
+            os.remove(file_path)
+
+
+# Read a single result or log file from a sweep archive
+def read_archive(archive_path: str, name: str) -> str:
+    with zipfile.ZipFile(archive_path) as archive:
+        return archive.read(name).decode()
+
+
 # Plot IPC values
 def plot_performance(performance_data: Dict[str, float]) -> None:
     if not performance_data:
@@ -712,6 +1242,18 @@ def main() -> None:
     # Create if it does not exist
     os.makedirs(f'{PATH}/simulator/results', exist_ok=True)
 
+    # Create if it does not exist
+    if trace_bpreds or profile_bpreds:
+        os.makedirs(f'{PATH}/simulator/results/traces', exist_ok=True)
+
+    # Create if it does not exist
+    if profile_bpreds:
+        os.makedirs(f'{PATH}/simulator/results/profiles', exist_ok=True)
+
+    # Create if it does not exist
+    if archive_sweeps:
+        os.makedirs(f'{PATH}/archive', exist_ok=True)
+
     # Set the Run.pl to specified paths
     setup()
 
@@ -719,7 +1261,7 @@ def main() -> None:
     init()
 
     # Run simulation commands
-    run_simulations()
+    sweep_files = run_simulations()
 
     # Parse performance data
     results_dir = f'{PATH}/simulator/results'
@@ -727,6 +1269,28 @@ def main() -> None:
     
     plot_performance(performance_avg_data)
 
+    traces_dir = f'{PATH}/simulator/results/traces'
+
+    # Evaluate combining predictors from the component traces
+    if trace_bpreds or profile_bpreds:
+        whatif_data = chooser_whatif(traces_dir)
+
+        with open(os.path.join(traces_dir, 'chooser_whatif.json'), 'w') as f:
+            json.dump(whatif_data, f, indent=4)
+
+        sweep_files.append(os.path.join(traces_dir, 'chooser_whatif.json'))
+
+    # Profile hot-spot branches per bpred config
+    if profile_bpreds:
+        profile_hotspots(traces_dir, f'{PATH}/simulator/results/profiles')
+
+        sweep_files.extend(f'{PATH}/simulator/results/profiles/{benchmark}.json' for benchmark in benchmarks)
+
+    # Keep this sweep for later comparisons
+    if archive_sweeps:
+        archive_path = f'{PATH}/archive/sweep_{strftime("%Y%m%d_%H%M%S")}.zip'
+        archive_sweep(archive_path, sweep_files, results_dir, f'{PATH}/logs', remove=True)
+
 
 if __name__ == '__main__':
     main()
@@ -999,3 +999,84 @@ bpred_update(struct bpred_t *pred,	/* branch predictor instance */
 	}
     }
 }
+
+/* write the header of a per-branch trace at the current file position */
+static void
+bpred_trace_header(struct bpred_trace_t *trace)	/* trace instance */
+{
+  word_t width;
+  qword_t count;
+
+  width = (trace->kind == BPredTraceHits) ? 1 : 8 * sizeof(md_addr_t);
+  count = (qword_t)trace->count;
+
+  if (fwrite(trace->kind == BPredTraceHits ? "BPBM" : "BPPC", 1, 4, trace->fd)
+      != 4
+      || fwrite(&width, sizeof(word_t), 1, trace->fd) != 1
+      || fwrite(&count, sizeof(qword_t), 1, trace->fd) != 1)
+    fatal("cannot write branch trace header");
+}
+
+/* open a per-branch trace file FNAME of type KIND */
+struct bpred_trace_t *			/* trace instance */
+bpred_trace_open(char *fname,		/* trace file name */
+		 enum bpred_trace_kind kind)/* type of trace */
+{
+  struct bpred_trace_t *trace;
+
+  if (!(trace = calloc(1, sizeof(struct bpred_trace_t))))
+    fatal("out of virtual memory");
+
+  trace->kind = kind;
+  if (!(trace->fd = fopen(fname, "wb")))
+    fatal("cannot open branch trace file `%s'", fname);
+
+  /* entry count is filled in by bpred_trace_close() */
+  bpred_trace_header(trace);
+
+  return trace;
+}
+
+/* append direction hit/miss CORRECT to a BPredTraceHits trace */
+void
+bpred_trace_hit(struct bpred_trace_t *trace,	/* trace instance */
+		int correct)		/* was direction prediction ok? */
+{
+  trace->bits = (trace->bits << 1) | (!!correct);
+  trace->nbits++;
+  trace->count++;
+
+  if (trace->nbits == 8)
+    {
+      fputc(trace->bits, trace->fd);
+      trace->bits = 0;
+      trace->nbits = 0;
+    }
+}
+
+/* append branch address BADDR to a BPredTraceAddrs trace */
+void
+bpred_trace_addr(struct bpred_trace_t *trace,	/* trace instance */
+		 md_addr_t baddr)	/* branch address */
+{
+  if (fwrite(&baddr, sizeof(md_addr_t), 1, trace->fd) != 1)
+    fatal("cannot write branch trace");
+  trace->count++;
+}
+
+/* flush pending entries, finalize the header and close a trace */
+void
+bpred_trace_close(struct bpred_trace_t *trace)	/* trace instance */
+{
+  if (trace == NULL)
+    return;
+
+  /* pad the last bitmap byte with zeros (i.e., misses) */
+  if (trace->nbits)
+    fputc(trace->bits << (8 - trace->nbits), trace->fd);
+
+  rewind(trace->fd);
+  bpred_trace_header(trace);
+  fclose(trace->fd);
+  free(trace);
+}
@@ -173,6 +173,23 @@ struct bpred_t {
   counter_t ras_hits;		/* num correct return-address predictions */
 };
 
+/* per-branch trace kinds, one entry per committed conditional branch */
+enum bpred_trace_kind {
+  BPredTraceHits,		/* packed direction-hit bitmap (1 bit/entry) */
+  BPredTraceAddrs		/* branch addresses (md_addr_t/entry) */
+};
+
+/* per-branch trace file, the file starts with a 16 byte header (4 byte
+   magic, 32-bit entry width in bits, 64-bit entry count) followed by the
+   entries; bitmap entries are packed MSB first and padded with zeros */
+struct bpred_trace_t {
+  enum bpred_trace_kind kind;	/* type of trace */
+  FILE *fd;			/* trace output stream */
+  counter_t count;		/* num entries written */
+  unsigned char bits;		/* pending bitmap bits */
+  int nbits;			/* num pending bitmap bits */
+};
+
 /* branch predictor update information */
 struct bpred_update_t {
   char *pdir1;		/* direction-1 predictor counter */
@@ -273,6 +290,25 @@ bpred_update(struct bpred_t *pred,	/* branch predictor instance */
 	     struct bpred_update_t *dir_update_ptr); /* pred state pointer */
 
 
+/* open a per-branch trace file FNAME of type KIND */
+struct bpred_trace_t *			/* trace instance */
+bpred_trace_open(char *fname,		/* trace file name */
+		 enum bpred_trace_kind kind);/* type of trace */
+
+/* append direction hit/miss CORRECT to a BPredTraceHits trace */
+void
+bpred_trace_hit(struct bpred_trace_t *trace,	/* trace instance */
+		int correct);		/* was direction prediction ok? */
+
+/* append branch address BADDR to a BPredTraceAddrs trace */
+void
+bpred_trace_addr(struct bpred_trace_t *trace,	/* trace instance */
+		 md_addr_t baddr);	/* branch address */
+
+/* flush pending entries, finalize the header and close a trace */
+void
+bpred_trace_close(struct bpred_trace_t *trace);	/* trace instance */
+
 #ifdef foo0
 /* OBSOLETE */
 /* dump branch predictor state (for debug) */
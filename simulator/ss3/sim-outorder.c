@@ -388,6 +388,14 @@ static struct cache_t *dtlb;
 /* branch predictor */
 static struct bpred_t *pred;
 
+/* per-branch direction hit bitmap trace file name and instance */
+static char *bpred_hit_trace_fname;
+static struct bpred_trace_t *bpred_hit_trace = NULL;
+
+/* per-branch address trace file name and instance */
+static char *bpred_addr_trace_fname;
+static struct bpred_trace_t *bpred_addr_trace = NULL;
+
 /* functional unit resource pool */
 static struct res_pool *fu_pool = NULL;
 
@@ -693,6 +701,16 @@ sim_reg_options(struct opt_odb_t *odb)
 		 &bpred_spec_opt, /* default */NULL,
 		 /* print */TRUE, /* format */NULL);
 
+  opt_reg_string(odb, "-bpred:trace",
+		 "dump committed cond branch dir hit bitmap to file",
+		 &bpred_hit_trace_fname, /* default */NULL,
+		 /* print */TRUE, /* format */NULL);
+
+  opt_reg_string(odb, "-bpred:trace_addr",
+		 "dump committed cond branch addresses to file",
+		 &bpred_addr_trace_fname, /* default */NULL,
+		 /* print */TRUE, /* format */NULL);
+
   /* decode options */
 
   opt_reg_int(odb, "-decode:width",
@@ -988,6 +1006,18 @@ sim_check_options(struct opt_odb_t *odb,        /* options database */
   else
     fatal("bad speculative update stage specifier, use {ID|WB}");
 
+  if (bpred_hit_trace_fname)
+    {
+      if (!pred)
+	fatal("branch hit trace requires a branch predictor (not `perfect')");
+      bpred_hit_trace = bpred_trace_open(bpred_hit_trace_fname,
+					 BPredTraceHits);
+    }
+
+  if (bpred_addr_trace_fname)
+    bpred_addr_trace = bpred_trace_open(bpred_addr_trace_fname,
+					BPredTraceAddrs);
+
   if (ruu_decode_width < 1 || (ruu_decode_width & (ruu_decode_width-1)) != 0)
     fatal("issue width must be positive non-zero and a power of two");
 
@@ -1456,6 +1486,10 @@ sim_uninit(void)
 {
   if (ptrace_nelt > 0)
     ptrace_close();
+
+  /* finalize per-branch traces */
+  bpred_trace_close(bpred_hit_trace);
+  bpred_trace_close(bpred_addr_trace);
 }
 
 
@@ -2243,6 +2277,18 @@ ruu_commit(void)
                        /* dir predictor update pointer */&rs->dir_update);
 	}
 
+      /* record committed conditional branches in per-branch traces */
+      if ((MD_OP_FLAGS(rs->op) & (F_CTRL|F_COND)) == (F_CTRL|F_COND))
+	{
+	  if (bpred_hit_trace)
+	    bpred_trace_hit(bpred_hit_trace,
+			    /* dir hit? */(rs->pred_PC != (rs->PC +
+							 sizeof(md_inst_t)))
+			    == (rs->next_PC != (rs->PC + sizeof(md_inst_t))));
+	  if (bpred_addr_trace)
+	    bpred_trace_addr(bpred_addr_trace, rs->PC);
+	}
+
       /* invalidate RUU operation instance */
       RUU[RUU_head].tag++;
       sim_slip += (sim_cycle - RUU[RUU_head].slip);
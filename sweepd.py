@@ -0,0 +1,555 @@
+#!/usr/bin/env python3
+
+import os
+import re
+import json
+import struct
+import shutil
+import zipfile
+import posixpath
+import threading
+import logging as log
+
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from itertools import count
+from multiprocessing import Pool
+from urllib.parse import urlparse, parse_qs
+from typing import Dict, List, Optional, Tuple
+
+import run
+
+
+# Localhost address the daemon listens on
+HOST = '127.0.0.1'
+PORT = 8587
+
+# Simulation workers shared by every client (None for all cores)
+WORKERS = None
+
+# Results (with traces/ and the Run.pl work/ directories) and logs of the
+# daemon's jobs, apart from run.py's so neither overwrites or archives the other's
+results_dir = os.path.join(run.PATH, 'simulator', 'results', 'sweepd')
+logs_dir = os.path.join(run.PATH, 'logs', 'sweepd')
+
+# Branch predictors a sweep may request
+bpreds = [
+        'nottaken',
+        'taken',
+        'bimod',
+        'gshare',
+        'gselect',
+        'comb_bimod_gshare',
+        'comb_bimod_gselect'
+        ]
+
+# Benchmarks Run.pl knows from bench.db, loaded once in main()
+bench_names = set()
+
+# Jobs by results file stem, a stem is only ever simulated once
+jobs = {}
+
+# Job stems by sweep id
+sweeps = {}
+sweep_ids = count(1)
+
+# Traces of done, traced jobs by file path, such a job is never simulated again
+traces = {}
+
+# Guards jobs, sweeps and traces, notified on every job state change
+state_lock = threading.Condition()
+
+# Warm worker pool, created once in main()
+pool = None
+
+
+# A trace is still being written by a queued job
+class TraceNotReady(Exception):
+    pass
+
+
+# A job was not simulated with traces
+class TraceMissing(Exception):
+    pass
+
+
+# Traces a traced job writes, the nottaken run writes the benchmark's branch addresses
+def trace_paths(benchmark: str, bpred: str, stem: str) -> List[str]:
+    traces_dir = os.path.join(results_dir, 'traces')
+
+    if bpred == 'nottaken':
+        return [os.path.join(traces_dir, f'{benchmark}.pc')]
+
+    if bpred == 'taken':
+        return []
+
+    return [os.path.join(traces_dir, f'{stem}.bm')]
+
+
+# Whether every trace of a job is complete, the header count is written last
+def job_traced(benchmark: str, bpred: str, stem: str) -> bool:
+    for file_path in trace_paths(benchmark, bpred, stem):
+        try:
+            if run.trace_count(file_path) == 0:
+                return False
+
+        except (OSError, ValueError, struct.error):
+            return False
+
+    return True
+
+
+# Benchmark names defined in a Run.pl benchmark database
+def load_benchmarks(db_path: str) -> None:
+    with open(db_path, 'r') as f:
+        bench_names.update(re.findall(r'^\$BINARIES\{"([^"]+)"\}', f.read(), re.MULTILINE))
+
+
+# Index a results file as a done job if it reports every metric
+def index_result(filename: str, content: str) -> None:
+    try:
+        bpred, benchmark, size = run.parse_filename(filename)
+
+    except AttributeError:
+        return
+
+    metrics = run.parse_metrics(content)
+
+    # CHECK results file is complete, incomplete ones are simulated again
+    if len(metrics) == len(run.perf_pattrns):
+        stem = filename[:-len('.out')]
+
+        jobs[stem] = {
+                'benchmark': benchmark,
+                'bpred': bpred,
+                'size': size,
+                'state': 'done',
+                # Only the daemon's own traces are served, run.py's results are untraced here
+                'traced': job_traced(benchmark, bpred, stem),
+                'metrics': metrics
+                }
+
+
+# Index the complete results left by earlier sweeps and daemons, later directories win
+def load_results(archive_dir: str, results_dirs: List[str]) -> None:
+    print('load_results(): Indexing results...')
+
+    # Archived sweeps first, oldest first, so newer results replace older ones
+    if os.path.isdir(archive_dir):
+        for archive_name in sorted(os.listdir(archive_dir)):
+            archive_path = os.path.join(archive_dir, archive_name)
+
+            # CHECK sweep archive
+            if not archive_name.endswith('.zip') or not zipfile.is_zipfile(archive_path):
+                continue
+
+            with zipfile.ZipFile(archive_path) as archive:
+                for name in archive.namelist():
+                    # CHECK results file, traces and profiles live in subdirectories
+                    if posixpath.dirname(name) == 'results' and name.endswith('.out'):
+                        index_result(posixpath.basename(name), archive.read(name).decode())
+
+    # Loop through results directories and their results files
+    for results_path in results_dirs:
+        for filename in os.listdir(results_path):
+            file_path = os.path.join(results_path, filename)
+
+            # CHECK results file
+            if not os.path.isfile(file_path) or not filename.endswith('.out'):
+                continue
+
+            with open(file_path, 'r') as f:
+                index_result(filename, f.read())
+
+
+# Simulate a job in a pool worker
+def simulate_job(benchmark: str, bpred: str, size: Optional[str], trace: bool) -> None:
+    # One Run.pl working directory per benchmark and worker, reused by every
+    # job the worker runs, so overlapping jobs never share one
+    run_dir = os.path.join(results_dir, 'work', f'{benchmark}_{os.getpid()}')
+    cmd, log_file, _ = run.sim_command(benchmark, bpred, size, run_dir, results_dir, logs_dir, trace)
+
+    run.simulation(cmd, log_file)
+
+
+# Queue a job on the warm pool, state_lock must be held
+def queue_job(stem: str, benchmark: str, bpred: str, size: Optional[str], trace: bool) -> None:
+    jobs[stem] = {
+            'benchmark': benchmark,
+            'bpred': bpred,
+            'size': size,
+            'state': 'queued',
+            # taken writes no traces, any of its runs serves a traced sweep
+            'traced': trace or bpred == 'taken',
+            'metrics': {}
+            }
+
+    pool.apply_async(simulate_job, (benchmark, bpred, size, trace),
+                     callback=lambda _, stem=stem: finish_job(stem),
+                     error_callback=lambda e, stem=stem: finish_job(stem, e))
+
+
+# Update a job once its simulation returned
+def finish_job(stem: str, error: Optional[BaseException] = None) -> None:
+    file_path = os.path.join(results_dir, f'{stem}.out')
+
+    metrics = {}
+    if error is None and os.path.isfile(file_path):
+        with open(file_path, 'r') as f:
+            metrics = run.parse_metrics(f.read())
+
+    with state_lock:
+        job = jobs[stem]
+
+        # CHECK every metric was reported
+        if len(metrics) == len(run.perf_pattrns):
+            job['state'] = 'done'
+            job['metrics'] = metrics
+            job['traced'] = job['traced'] and job_traced(job['benchmark'], job['bpred'], stem)
+
+        else:
+            job['state'] = 'failed'
+            job['error'] = str(error) if error else f'{file_path} is incomplete'
+
+        # CHECK a sweep asked for traces while the job ran without them
+        if job.pop('retrace', False) and not (job['state'] == 'done' and job['traced']):
+            queue_job(stem, job['benchmark'], job['bpred'], job['size'], True)
+
+        state_lock.notify_all()
+
+
+# Queue the jobs of a sweep that are not queued or done already
+def submit_sweep(request: Dict[str, object]) -> Dict[str, object]:
+    # CHECK request is a JSON object
+    if not isinstance(request, dict):
+        raise ValueError('request must be a JSON object')
+
+    sweep_benchmarks = request.get('benchmarks', run.benchmarks)
+    sweep_bpreds = request.get('bpreds', bpreds)
+    sweep_sizes = request.get('sizes', run.sizes)
+    trace = request.get('trace', False)
+
+    # CHECK lists of strings, a string alone would be iterated by character
+    for key, values in (('benchmarks', sweep_benchmarks), ('bpreds', sweep_bpreds), ('sizes', sweep_sizes)):
+        if not isinstance(values, list) or not all(isinstance(value, str) for value in values):
+            raise ValueError(f'{key} must be a list of strings')
+
+    # CHECK request, the values end up in a shell command
+    for benchmark in sweep_benchmarks:
+        if benchmark not in bench_names:
+            raise ValueError(f'unknown benchmark: {benchmark}')
+
+    for bpred in sweep_bpreds:
+        if bpred not in bpreds:
+            raise ValueError(f'bad bpred: {bpred}')
+
+    for size in sweep_sizes:
+        if not re.fullmatch(r'\d+', size) or int(size) < 16 or int(size) & (int(size) - 1):
+            raise ValueError(f'bad size: {size}')
+
+    if not isinstance(trace, bool):
+        raise ValueError(f'bad trace: {trace}')
+
+    # Basic predictors do not depend on size
+    configs = []
+    for benchmark in sweep_benchmarks:
+        for bpred in sweep_bpreds:
+            if bpred in ('nottaken', 'taken'):
+                configs.append((benchmark, bpred, None))
+
+            else:
+                configs.extend((benchmark, bpred, size) for size in sweep_sizes)
+
+    stems = []
+    queued = 0
+
+    with state_lock:
+        for benchmark, bpred, size in configs:
+            stem = run.sim_stem(benchmark, bpred, size)
+            stems.append(stem)
+
+            job = jobs.get(stem)
+
+            # CHECK job is in flight or done already, with traces if the sweep needs them
+            if job and job['state'] in ('queued', 'done') and (job['traced'] or not trace):
+                continue
+
+            queued += 1
+
+            # CHECK job is in flight without traces, rerun it traced once it returned
+            if job and job['state'] == 'queued':
+                job['retrace'] = True
+                continue
+
+            queue_job(stem, benchmark, bpred, size, trace)
+
+        sweep_id = str(next(sweep_ids))
+        sweeps[sweep_id] = stems
+
+    log.info(f'Sweep {sweep_id}: {len(stems)} jobs, {queued} queued, {len(stems) - queued} deduplicated')
+
+    return {
+            'sweep': sweep_id,
+            'jobs': stems,
+            'queued': queued,
+            'deduplicated': len(stems) - queued
+            }
+
+
+# State of every job of a sweep
+def sweep_status(sweep_id: str) -> Dict[str, object]:
+    with state_lock:
+        status = {stem: jobs[stem]['state'] for stem in sweeps[sweep_id]}
+
+    return {
+            'sweep': sweep_id,
+            'jobs': status,
+            'finished': all(state in ('done', 'failed') for state in status.values())
+            }
+
+
+# Metrics of the done jobs matching benchmark, bpred and size
+def query_results(query: Dict[str, str]) -> Dict[str, object]:
+    with state_lock:
+        return {
+                stem: {
+                    'benchmark': job['benchmark'],
+                    'bpred': job['bpred'],
+                    'size': job['size'],
+                    'metrics': job['metrics']
+                    }
+                for stem, job in jobs.items()
+                if job['state'] == 'done' and all(job.get(key) == val for key, val in query.items())
+                }
+
+
+# Read a trace written by job stem through the in-memory cache
+def cached_trace(file_path: str, stem: str) -> Tuple[object, int]:
+    with state_lock:
+        # CHECK trace cached
+        if file_path in traces:
+            return traces[file_path]
+
+        # Only a done, traced job's trace is final, others may still be written or rerun
+        done = stem in jobs and jobs[stem]['state'] == 'done' and jobs[stem]['traced']
+
+    trace = run.read_trace(file_path)
+
+    # CHECK trace is final
+    if done:
+        with state_lock:
+            traces[file_path] = trace
+
+    return trace
+
+
+# Evaluate a bimod + 2lev chooser from cached component traces
+def query_whatif(query: Dict[str, str]) -> Dict[str, float]:
+    # CHECK required params
+    for key in ('benchmark', 'bimod_size'):
+        if key not in query:
+            raise ValueError(f'missing {key}')
+
+    benchmark = query['benchmark']
+    twolev = query.get('twolev', 'gshare')
+    bimod_size = query['bimod_size']
+    twolev_size = query.get('twolev_size', bimod_size)
+    meta_size = query.get('meta_size', run.meta_sizes[0])
+
+    # CHECK query, the values end up in trace file paths
+    if benchmark not in bench_names:
+        raise ValueError(f'unknown benchmark: {benchmark}')
+
+    if twolev not in ('gshare', 'gselect'):
+        raise ValueError(f'bad twolev: {twolev}')
+
+    for size in (bimod_size, twolev_size, meta_size):
+        if not re.fullmatch(r'\d+', size) or int(size) < 1 or int(size) & (int(size) - 1):
+            raise ValueError(f'bad size: {size}')
+
+    bimod_stem = run.sim_stem(benchmark, 'bimod', bimod_size)
+    twolev_stem = run.sim_stem(benchmark, twolev, twolev_size)
+
+    # CHECK every job ran with traces and none is still writing them, the nottaken run writes the addresses
+    with state_lock:
+        for stem in (f'{benchmark}_nottaken', bimod_stem, twolev_stem):
+            if stem in jobs and jobs[stem]['state'] == 'queued':
+                raise TraceNotReady(f'trace not complete: {stem} is queued')
+
+            if stem not in jobs or jobs[stem]['state'] != 'done' or not jobs[stem]['traced']:
+                raise TraceMissing(f'no trace of {stem}, submit it with "trace": true')
+
+    traces_dir = os.path.join(results_dir, 'traces')
+    pcs, pcs_count = cached_trace(os.path.join(traces_dir, f'{benchmark}.pc'), f'{benchmark}_nottaken')
+    bimod_bits, bimod_count = cached_trace(os.path.join(traces_dir, f'{bimod_stem}.bm'), bimod_stem)
+    twolev_bits, twolev_count = cached_trace(os.path.join(traces_dir, f'{twolev_stem}.bm'), twolev_stem)
+
+    # Evaluate the committed branches in common, see chooser_whatif()
+    count = min(pcs_count, bimod_count, twolev_count)
+
+    # CHECK traces were closed, the header count is written last
+    if count == 0:
+        raise TraceNotReady(f'trace not complete: {benchmark} has no committed branches')
+
+    return run.evaluate_chooser(bimod_bits, twolev_bits, pcs, count, int(meta_size))
+
+
+# HTTP API
+#   POST /sweeps                 submit {"benchmarks": [], "bpreds": [], "sizes": [],
+#                                "trace": false}
+#   GET  /sweeps/<id>            job states of a sweep
+#   GET  /sweeps/<id>/progress   stream job state changes, one JSON line each
+#   GET  /results?<filters>      metrics of done jobs (benchmark, bpred, size)
+#   GET  /whatif?<params>        chooser what-if (benchmark, twolev, bimod_size,
+#                                twolev_size, meta_size)
+class SweepHandler(BaseHTTPRequestHandler):
+    def send_json(self, code: int, data: object) -> None:
+        body = json.dumps(data, indent=4).encode()
+
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self) -> None:
+        url = urlparse(self.path)
+
+        # CHECK route
+        if url.path != '/sweeps':
+            self.send_json(404, {'error': f'unknown path {url.path}'})
+            return
+
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            self.send_json(200, submit_sweep(request))
+
+        except (ValueError, TypeError, AttributeError) as e:
+            self.send_json(400, {'error': str(e)})
+
+    def do_GET(self) -> None:
+        url = urlparse(self.path)
+        parts = url.path.strip('/').split('/')
+        query = {key: vals[-1] for key, vals in parse_qs(url.query).items()}
+
+        try:
+            if parts[0] == 'sweeps' and len(parts) == 2:
+                self.send_json(200, sweep_status(parts[1]))
+
+            elif parts[0] == 'sweeps' and len(parts) == 3 and parts[2] == 'progress':
+                self.stream_progress(parts[1])
+
+            elif parts == ['results']:
+                self.send_json(200, query_results(query))
+
+            elif parts == ['whatif']:
+                self.send_json(200, query_whatif(query))
+
+            else:
+                self.send_json(404, {'error': f'unknown path {url.path}'})
+
+        except KeyError as e:
+            self.send_json(404, {'error': f'unknown {e}'})
+
+        except TraceNotReady as e:
+            self.send_json(409, {'error': str(e)})
+
+        except TraceMissing as e:
+            self.send_json(404, {'error': str(e)})
+
+        except FileNotFoundError as e:
+            self.send_json(404, {'error': f'missing trace {e.filename}'})
+
+        except (ValueError, TypeError) as e:
+            self.send_json(400, {'error': str(e)})
+
+    # Stream job state changes until every job of the sweep finished
+    def stream_progress(self, sweep_id: str) -> None:
+        # CHECK sweep exists before starting the stream
+        with state_lock:
+            stems = sweeps[sweep_id]
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.end_headers()
+
+        reported = {}
+
+        while True:
+            with state_lock:
+                status = {stem: jobs[stem]['state'] for stem in stems}
+                changed = {stem: state for stem, state in status.items() if reported.get(stem) != state}
+                finished = all(state in ('done', 'failed') for state in status.values())
+
+                # Nothing new yet, wait for the next job state change
+                if not changed and not finished:
+                    state_lock.wait()
+                    continue
+
+            try:
+                for stem, state in changed.items():
+                    self.wfile.write((json.dumps({'job': stem, 'state': state}) + '\n').encode())
+
+                if finished:
+                    done = sum(state == 'done' for state in status.values())
+                    self.wfile.write((json.dumps({'sweep': sweep_id, 'finished': True, 'done': done, 'failed': len(status) - done}) + '\n').encode())
+
+                self.wfile.flush()
+
+            # Client went away, the jobs keep running
+            except (BrokenPipeError, ConnectionResetError):
+                return
+
+            reported.update(changed)
+
+            if finished:
+                return
+
+    def log_message(self, format: str, *args) -> None:
+        log.info(f'{self.address_string()} {format % args}')
+
+
+def main() -> None:
+    global pool
+
+    log.basicConfig(level=log.INFO,
+                    format='%(asctime)s - %(levelname)s - %(message)s',
+                    datefmt='%Y-%m-%d %H:%M')
+
+    # Create if it does not exist
+    os.makedirs(logs_dir, exist_ok=True)
+
+    # Working directories are per worker process, drop the ones of earlier daemons
+    shutil.rmtree(os.path.join(results_dir, 'work'), ignore_errors=True)
+    os.makedirs(os.path.join(results_dir, 'work'), exist_ok=True)
+
+    # Create if it does not exist, any sweep may ask for traces
+    os.makedirs(os.path.join(results_dir, 'traces'), exist_ok=True)
+
+    # Set the Run.pl to specified paths once for every sweep
+    run.setup()
+
+    load_benchmarks(f'{run.PATH}/simulator/bench.db')
+
+    # Results of run.py sweeps, then the daemon's own
+    load_results(f'{run.PATH}/archive', [f'{run.PATH}/simulator/results', results_dir])
+
+    # Start the pool before any server thread exists
+    pool = Pool(WORKERS)
+
+    server = ThreadingHTTPServer((HOST, PORT), SweepHandler)
+    server.daemon_threads = True
+    print(f'main(): Serving sweeps on http://{HOST}:{PORT}')
+
+    try:
+        server.serve_forever()
+
+    except KeyboardInterrupt:
+        pass
+
+    finally:
+        server.server_close()
+        pool.terminate()
+
+
+if __name__ == '__main__':
+    main()